@@ -0,0 +1,82 @@
+"""Buffered audit trail writer.
+
+Request handlers append audit events to an in-memory buffer; a background
+thread inserts them in batches when the buffer reaches ``batch_size`` or every
+``flush_interval`` seconds, whichever comes first. ``sync=True`` writes every
+event immediately (useful for tests and scripts).
+"""
+import threading
+import traceback
+
+from database import retry_on_busy
+
+
+class AuditWriter:
+    def __init__(self, engine, table, batch_size=500, flush_interval=1.0, sync=False):
+        self.engine = engine
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sync = sync
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def log(self, event):
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.batch_size
+        if self.sync:
+            # Callers log after committing their change; a failed write must not turn that into an error.
+            # The event stays buffered for the next flush.
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+        elif full:
+            self._wake.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            try:
+                self._insert(batch)
+            except Exception:
+                # Keep the events and try again on the next flush.
+                with self._lock:
+                    self._buffer[:0] = batch
+                raise
+
+    @retry_on_busy
+    def _insert(self, batch):
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert(), batch)
+
+    def start(self):
+        if self.sync or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
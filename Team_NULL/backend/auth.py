@@ -0,0 +1,82 @@
+"""Signed bearer tokens and a cache of authenticated principals.
+
+Tokens are HS256 JWTs carrying the user id and an expiry, so verifying one
+needs no database access. The user's current role is looked up through
+``PrincipalCache``, which holds recently seen users for ``ttl`` seconds and
+is invalidated when a user is deleted or changed.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+import jwt
+
+from fileutil import create_key_file
+
+TOKEN_ALGORITHM = 'HS256'
+
+# The parts of a User that request handlers need; immutable, so safe to share across threads
+Principal = namedtuple('Principal', ['id', 'email', 'name', 'role'])
+
+
+def ensure_secret_key(key_file):
+    """The token signing key from ``key_file``, created (mode 0600) with a random key if missing."""
+    create_key_file(key_file, lambda: secrets.token_urlsafe(64))
+    with open(key_file) as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f'{key_file} is empty; delete it or set SECRET_KEY')
+    return key
+
+
+def encode_token(user_id, secret, expires_in):
+    now = datetime.now(timezone.utc)
+    return jwt.encode({'sub': user_id, 'iat': now, 'exp': now + expires_in}, secret, algorithm=TOKEN_ALGORITHM)
+
+
+def decode_token(token, secret):
+    """Return the user id of a valid token, or None if it is malformed, forged or expired."""
+    try:
+        payload = jwt.decode(token, secret, algorithms=[TOKEN_ALGORITHM], options={'require': ['sub', 'exp']})
+    except jwt.InvalidTokenError:
+        return None
+    return payload['sub']
+
+
+class PrincipalCache:
+    """Thread-safe TTL cache with least-recently-used eviction."""
+
+    def __init__(self, max_size=1024, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,322 @@
+"""Benchmark harness for the Flask DMS API.
+
+Seeds a throwaway database (in a temporary directory) with users, documents,
+workflows and audit events, drives the main endpoints from several threads
+and prints a JSON report with throughput and p50/p95/p99 latency per scenario.
+
+    python benchmark.py --documents 5000 --requests 300 --concurrency 8 --output after.json
+    python benchmark.py --compare before.json --threshold 0.2
+
+Requests go through Flask's test client, so the numbers measure the app and
+the database, not the network or a WSGI server. ``--compare`` prints the p95
+change against an earlier report and exits with status 1 if any scenario got
+slower than ``--threshold`` (a fraction).
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+WORDS = (
+    'contract invoice policy report budget audit compliance vendor payroll invoice '
+    'agreement renewal tax quarterly summary proposal review license insurance memo'
+).split()
+TAGS = ['finance', 'legal', 'hr', 'sales', 'ops', 'urgent', 'archive', 'draft']
+FILE_TYPES = ['pdf', 'txt', 'docx', 'png']
+PASSWORD = 'benchmark'
+SCENARIOS = ('list', 'search', 'filter', 'upload', 'download', 'dashboard', 'audit_trail', 'workflows')
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed(m, args, rng):
+    """Bulk-insert the benchmark data set; returns ids the scenarios need."""
+    db = m.db
+    now = datetime.utcnow()
+    # Hashing is deliberately slow, so every seeded user shares one hash
+    password_hash = m.generate_password_hash(PASSWORD)
+    users = [{
+        'id': str(uuid.uuid4()), 'email': f'user{i}@bench.local', 'name': f'User {i}',
+        'role': 'admin' if i == 0 else rng.choice(['user', 'user', 'manager']),
+        'password_hash': password_hash, 'created_at': now
+    } for i in range(args.users)]
+    db.session.execute(m.User.__table__.insert(), users)
+
+    # A few distinct files, shared by many documents through the blob store
+    blobs = []
+    for i in range(args.blobs):
+        digest, size = m.blob_store.put_stream(io.BytesIO(os.urandom(rng.randint(1, 64) * 1024)))
+        blobs.append({'hash': digest, 'size': size, 'ref_count': 0, 'created_at': now})
+
+    documents, document_tags = [], []
+    for i in range(args.documents):
+        blob = rng.choice(blobs)
+        blob['ref_count'] += 1
+        tags = rng.sample(TAGS, rng.randint(0, 3))
+        updated_at = now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600))
+        document = {
+            'id': str(uuid.uuid4()), 'name': f'{rng.choice(WORDS)}-{i}', 'type': rng.choice(FILE_TYPES),
+            'size': blob['size'], 'tags': json.dumps(tags), 'encrypted': rng.random() < 0.1,
+            'access_level': rng.choice(['private', 'shared', 'public']),
+            'status': rng.choice(['draft', 'pending', 'approved', 'rejected']),
+            'owner_id': rng.choice(users)['id'],
+            'content': ' '.join(rng.choice(WORDS) for _ in range(args.words)),
+            'content_status': 'ready', 'file_path': m.blob_store.path_for(blob['hash']),
+            'content_hash': blob['hash'], 'required_privilege': 'user',
+            'created_at': updated_at, 'updated_at': updated_at
+        }
+        documents.append(document)
+        document_tags.extend({'document_id': document['id'], 'tag': tag} for tag in tags)
+    db.session.execute(m.Blob.__table__.insert(), blobs)
+    # FTS triggers index the documents as they are inserted
+    db.session.execute(m.Document.__table__.insert(), documents)
+    if document_tags:
+        db.session.execute(m.DocumentTag.__table__.insert(), document_tags)
+    tag_counts = Counter(row['tag'] for row in document_tags)
+    if tag_counts:
+        db.session.execute(m.TagCount.__table__.insert(), [{'tag': t, 'count': n} for t, n in tag_counts.items()])
+
+    workflows, steps = [], []
+    for i in range(args.workflows):
+        workflow_id = str(uuid.uuid4())
+        updated_at = now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600))
+        workflows.append({
+            'id': workflow_id, 'name': f'Workflow {i}', 'description': 'Benchmark workflow',
+            'status': rng.choice(['active', 'draft', 'completed']), 'assignees': '[]',
+            'created_at': updated_at, 'updated_at': updated_at
+        })
+        for position in range(args.steps):
+            steps.append({
+                'id': str(uuid.uuid4()), 'name': f'Step {position}', 'description': 'Benchmark step',
+                'status': 'pending', 'assignee': rng.choice(users)['email'], 'workflow_id': workflow_id,
+                'position': position, 'created_at': updated_at, 'updated_at': updated_at
+            })
+    if workflows:
+        db.session.execute(m.Workflow.__table__.insert(), workflows)
+    if steps:
+        db.session.execute(m.WorkflowStep.__table__.insert(), steps)
+
+    audit_rows = [{
+        'id': str(uuid.uuid4()), 'document_id': rng.choice(documents)['id'] if documents else None,
+        'user_id': rng.choice(users)['id'], 'action': rng.choice(['create', 'download', 'update', 'share']),
+        'timestamp': now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600)), 'details': 'Benchmark event.'
+    } for _ in range(args.audit)]
+    if audit_rows:
+        db.session.execute(m.AuditTrail.__table__.insert(), audit_rows)
+
+    m.recompute_document_counters()
+    db.session.commit()
+    return {'users': users, 'documents': documents}
+
+
+def login(client, email):
+    response = client.post('/api/token', json={'username': email, 'password': PASSWORD})
+    return {'Authorization': f"Bearer {response.json['access_token']}"}
+
+
+def scenario_requests(name, rng, headers, documents):
+    """A function issuing one request of the named scenario with a test client."""
+    if name == 'list':
+        return lambda client: client.get('/api/documents?limit=50', headers=rng.choice(headers))
+    if name == 'search':
+        return lambda client: client.get(f'/api/documents?search={rng.choice(WORDS)}&limit=20', headers=rng.choice(headers))
+    if name == 'filter':
+        return lambda client: client.get(
+            f'/api/documents?file_type={rng.choice(FILE_TYPES)}&tags={rng.choice(TAGS)}&status=approved&limit=50',
+            headers=rng.choice(headers)
+        )
+    if name == 'upload':
+        def upload(client):
+            data = {'file': (io.BytesIO(os.urandom(4096)), f'bench-{uuid.uuid4().hex}.txt'), 'tags': json.dumps([rng.choice(TAGS)])}
+            return client.post('/api/documents', headers=rng.choice(headers), data=data, content_type='multipart/form-data')
+        return upload
+    if name == 'download':
+        # The admin token (first) can read every document
+        public = [doc['id'] for doc in documents if doc['access_level'] != 'private'] or [doc['id'] for doc in documents]
+        return lambda client: client.get(f'/api/documents/{rng.choice(public)}/download', headers=headers[0])
+    if name == 'dashboard':
+        return lambda client: client.get('/api/dashboard/stats', headers=rng.choice(headers))
+    if name == 'audit_trail':
+        return lambda client: client.get('/api/audit/trail?limit=100', headers=headers[0])
+    if name == 'workflows':
+        return lambda client: client.get('/api/workflows?limit=50', headers=rng.choice(headers))
+    raise ValueError(f'Unknown scenario: {name}')
+
+
+def run_scenario(app, request, total, concurrency):
+    latencies, errors = [], Counter()
+    lock = threading.Lock()
+    remaining = iter(range(total))
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            start = time.perf_counter()
+            response = request(client)
+            # Read the body so streamed downloads are fully sent
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            response.close()
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors[response.status_code] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - started
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': dict(errors),
+        'seconds': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 0.50)),
+            'p95': ms(percentile(latencies, 0.95)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print p95 changes against ``baseline``; returns True if any scenario regressed."""
+    regressed = False
+    for name, result in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name, {}).get('latency_ms', {}).get('p95')
+        after = result['latency_ms']['p95']
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        flag = 'REGRESSION' if change > threshold else ''
+        regressed = regressed or bool(flag)
+        print(f'{name:12} p95 {before:9.2f} -> {after:9.2f} ms ({change:+.1%}) {flag}', file=sys.stderr)
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--documents', type=int, default=2000)
+    parser.add_argument('--workflows', type=int, default=200)
+    parser.add_argument('--steps', type=int, default=5, help='steps per workflow')
+    parser.add_argument('--audit', type=int, default=10000, help='audit events')
+    parser.add_argument('--blobs', type=int, default=20, help='distinct stored files')
+    parser.add_argument('--words', type=int, default=200, help='words of text per document')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON report to compare p95 latency against')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--keep', action='store_true', help='keep the temporary database directory')
+    args = parser.parse_args(argv)
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}')
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='dms-bench-')
+    cwd = os.getcwd()
+    try:
+        # app.py creates its database and upload folders on import, so point it at the temp dir first
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.chdir(workdir)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        # Keep stdout clean for the JSON report (PyMuPDF prints a notice on import)
+        with contextlib.redirect_stdout(sys.stderr):
+            import app as m
+
+        with m.app.app_context():
+            started = time.perf_counter()
+            data = seed(m, args, rng)
+            seed_seconds = time.perf_counter() - started
+
+        client = m.app.test_client()
+        emails = [user['email'] for user in data['users'][:max(1, min(8, args.users))]]
+        headers = [login(client, email) for email in emails]
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            },
+            'seed': {
+                'seconds': round(seed_seconds, 3),
+                'users': args.users, 'documents': args.documents,
+                'workflows': args.workflows, 'audit_events': args.audit,
+            },
+            'scenarios': {},
+        }
+        for name in scenarios:
+            request = scenario_requests(name, rng, headers, data['documents'])
+            report['scenarios'][name] = run_scenario(m.app, request, args.requests, args.concurrency)
+        m.job_queue.shutdown(wait=False)
+        m.audit_writer.shutdown()
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f'Benchmark data kept in {workdir}', file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""Envelope encryption of stored files with chunked AES-256-GCM.
+
+Every file gets its own random data key. The data key is stored in the file
+header, wrapped (AES-GCM) with the master key, so rotating the master key only
+means rewrapping headers, and a leaked file reveals nothing without it.
+
+The body is split into ``chunk_size`` plaintext chunks, each sealed separately,
+so files of any size are encrypted and decrypted in constant memory and a
+byte range can be read by decrypting only the chunks it covers. Chunk nonces
+are ``prefix (7 bytes) | chunk index (4) | last-chunk flag (1)`` and the
+header is authenticated with every chunk, so chunks cannot be reordered,
+dropped, truncated or moved to another file without failing decryption.
+
+    header  magic | chunk size | master key id | wrap nonce | wrapped data key | nonce prefix
+    body    chunk 0 ciphertext + tag | chunk 1 ... | last chunk (may be short or empty)
+
+The master key is 32 bytes, read from the ``ENCRYPTION_KEY`` environment
+variable (URL-safe base64) or from a key file.
+"""
+import base64
+import hashlib
+import os
+import struct
+import uuid
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from fileutil import create_key_file, replace_durably
+
+MAGIC = b'DMSE\x01'
+CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+KEY_SIZE = 32
+HEADER = struct.Struct('>5sI8s12s48s7s')
+
+
+class EncryptionError(Exception):
+    pass
+
+
+def encode_key(key):
+    return base64.urlsafe_b64encode(key).decode()
+
+
+def decode_key(value):
+    try:
+        key = base64.urlsafe_b64decode(value.strip())
+    except ValueError:
+        raise EncryptionError('Master key is not valid base64')
+    if len(key) != KEY_SIZE:
+        raise EncryptionError(f'Master key must be {KEY_SIZE} bytes')
+    return key
+
+
+def load_master_key(key_file=None):
+    """The master key from ``ENCRYPTION_KEY``, else from ``key_file``."""
+    if os.environ.get('ENCRYPTION_KEY'):
+        return decode_key(os.environ['ENCRYPTION_KEY'])
+    if key_file and os.path.exists(key_file):
+        with open(key_file) as f:
+            return decode_key(f.read())
+    raise EncryptionError('No master key: set ENCRYPTION_KEY or create the key file')
+
+
+def ensure_master_key(key_file):
+    """Like ``load_master_key``, but creates ``key_file`` (mode 0600) if there is no key yet."""
+    if not os.environ.get('ENCRYPTION_KEY'):
+        create_key_file(key_file, lambda: encode_key(os.urandom(KEY_SIZE)))
+    return load_master_key(key_file)
+
+
+def key_id(master_key):
+    return hashlib.sha256(master_key).digest()[:8]
+
+
+def _nonce(prefix, index, last):
+    return prefix + index.to_bytes(4, 'big') + (b'\x01' if last else b'\x00')
+
+
+def encrypt_stream(source, target, master_key, chunk_size=CHUNK_SIZE):
+    """Encrypt file object ``source`` into ``target``; returns the plaintext size."""
+    data_key = AESGCM.generate_key(bit_length=KEY_SIZE * 8)
+    wrap_nonce = os.urandom(12)
+    header = HEADER.pack(
+        MAGIC, chunk_size, key_id(master_key), wrap_nonce,
+        AESGCM(master_key).encrypt(wrap_nonce, data_key, MAGIC), os.urandom(7)
+    )
+    prefix = header[-7:]
+    cipher = AESGCM(data_key)
+    target.write(header)
+    size = 0
+    index = 0
+    # Read one chunk ahead: the last chunk is sealed with a different nonce
+    chunk = source.read(chunk_size)
+    while True:
+        following = source.read(chunk_size) if len(chunk) == chunk_size else b''
+        last = not following
+        target.write(cipher.encrypt(_nonce(prefix, index, last), chunk, header))
+        size += len(chunk)
+        if last:
+            return size
+        chunk = following
+        index += 1
+
+
+def encrypt_file(source_path, target_path, master_key, chunk_size=CHUNK_SIZE):
+    """Encrypt ``source_path`` into ``target_path`` atomically; returns the plaintext size."""
+    tmp_path = f'{target_path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(source_path, 'rb') as source, open(tmp_path, 'wb') as target:
+            size = encrypt_stream(source, target, master_key, chunk_size)
+        replace_durably(tmp_path, target_path)
+        return size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def decrypt_file(source_path, target_path, master_key):
+    """Decrypt ``source_path`` into ``target_path`` atomically; returns the plaintext size."""
+    tmp_path = f'{target_path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with EncryptedFile(source_path, master_key) as source, open(tmp_path, 'wb') as target:
+            for chunk in source.iter_range():
+                target.write(chunk)
+            size = source.size
+        replace_durably(tmp_path, target_path)
+        return size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class EncryptedFile:
+    """Random-access reader for an encrypted file."""
+
+    def __init__(self, path, master_key):
+        self._file = open(path, 'rb')
+        try:
+            self._open(master_key)
+        except Exception:
+            self._file.close()
+            raise
+
+    def _open(self, master_key):
+        self.header = self._file.read(HEADER.size)
+        if len(self.header) != HEADER.size:
+            raise EncryptionError('Not an encrypted file')
+        magic, self.chunk_size, file_key_id, wrap_nonce, wrapped_key, self._prefix = HEADER.unpack(self.header)
+        if magic != MAGIC:
+            raise EncryptionError('Not an encrypted file')
+        if file_key_id != key_id(master_key):
+            raise EncryptionError('File was encrypted with a different master key')
+        try:
+            self._cipher = AESGCM(AESGCM(master_key).decrypt(wrap_nonce, wrapped_key, MAGIC))
+        except InvalidTag:
+            raise EncryptionError('Data key does not authenticate')
+        body = os.fstat(self._file.fileno()).st_size - HEADER.size
+        sealed_chunk = self.chunk_size + TAG_SIZE
+        self.chunks = max(1, -(-body // sealed_chunk))
+        self.size = body - self.chunks * TAG_SIZE
+        if self.size < 0:
+            raise EncryptionError('Encrypted file is truncated')
+
+    def _read_chunk(self, index):
+        sealed_chunk = self.chunk_size + TAG_SIZE
+        self._file.seek(HEADER.size + index * sealed_chunk)
+        data = self._file.read(sealed_chunk)
+        try:
+            return self._cipher.decrypt(_nonce(self._prefix, index, index == self.chunks - 1), data, self.header)
+        except InvalidTag:
+            raise EncryptionError(f'Chunk {index} does not authenticate')
+
+    def iter_range(self, start=0, stop=None):
+        """Yield the plaintext bytes ``start:stop``, decrypting one chunk at a time."""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return
+        for index in range(start // self.chunk_size, (stop - 1) // self.chunk_size + 1):
+            offset = index * self.chunk_size
+            chunk = self._read_chunk(index)
+            yield chunk[max(start - offset, 0):stop - offset]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_encryption_job(payload):
+    """Job entry point: encrypt or decrypt one stored file (runs in a worker process).
+
+    Does nothing if the target already exists, so repeated jobs are harmless.
+    """
+    master_key = load_master_key(payload['key_file'])
+    if os.path.exists(payload['target']):
+        return {'size': None}
+    if payload['encrypt']:
+        return {'size': encrypt_file(payload['source'], payload['target'], master_key)}
+    return {'size': decrypt_file(payload['source'], payload['target'], master_key)}
@@ -0,0 +1,132 @@
+"""Text extraction, run inside job worker processes.
+
+Each file type maps to an extractor in ``EXTRACTORS``. Extractors split a
+file into pages so large documents can be extracted as several page-range
+jobs in parallel; formats without pages (plain text, DOCX, images) report a
+single page.
+"""
+import zipfile
+from xml.etree import ElementTree
+
+from PIL import Image
+
+from ocr import IMAGE_TYPES, OcrEngine
+
+try:
+    import fitz  # PyMuPDF, used for the PDF text layer and to rasterize scanned pages
+except ImportError:
+    fitz = None
+
+PAGES_PER_JOB = 8
+# PDF pages with less text than this but with images are treated as scanned and OCRed
+MIN_TEXT_LAYER_CHARS = 20
+OCR_DPI = 300
+
+EXTRACTORS = {}
+
+
+def register_extractor(*file_types):
+    def decorator(cls):
+        for file_type in file_types:
+            EXTRACTORS[file_type] = cls()
+        return cls
+    return decorator
+
+
+def get_extractor(file_type):
+    return EXTRACTORS.get(file_type.lower())
+
+
+def page_ranges(page_count, pages_per_job=PAGES_PER_JOB):
+    """Split ``page_count`` pages into ``(first, last)`` ranges, ``last`` exclusive."""
+    return [(first, min(first + pages_per_job, page_count)) for first in range(0, page_count, pages_per_job)]
+
+
+@register_extractor('txt')
+class PlainTextExtractor:
+    def page_count(self, file_path):
+        return 1
+
+    def extract_pages(self, file_path, first, last, ocr):
+        with open(file_path, encoding='utf-8', errors='replace') as f:
+            return [f.read()]
+
+
+@register_extractor('pdf')
+class PdfExtractor:
+    def page_count(self, file_path):
+        if fitz is None:
+            raise RuntimeError('PyMuPDF is required for PDF text extraction')
+        with fitz.open(file_path) as pdf:
+            return pdf.page_count
+
+    def extract_pages(self, file_path, first, last, ocr):
+        if fitz is None:
+            raise RuntimeError('PyMuPDF is required for PDF text extraction')
+        texts = []
+        with fitz.open(file_path) as pdf:
+            for number in range(first, last):
+                page = pdf[number]
+                text = page.get_text()
+                if len(text.strip()) < MIN_TEXT_LAYER_CHARS and page.get_images():
+                    text = self._ocr_page(page, ocr)
+                texts.append(text)
+        return texts
+
+    def _ocr_page(self, page, ocr):
+        # Render no larger than the OCR pipeline would downsample to anyway
+        zoom = min(OCR_DPI / 72, ocr.settings['max_side'] / max(page.rect.width, page.rect.height))
+        with ocr.stage('render'):
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+            image = Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+        return ocr.image_to_text(image)
+
+
+@register_extractor('docx')
+class DocxExtractor:
+    WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+    def page_count(self, file_path):
+        # Page breaks are decided by the renderer, so a DOCX is one "page"
+        return 1
+
+    def extract_pages(self, file_path, first, last, ocr):
+        with zipfile.ZipFile(file_path) as archive:
+            with archive.open('word/document.xml') as f:
+                return [self._paragraphs(f)]
+
+    def _paragraphs(self, f):
+        paragraphs = []
+        # iterparse keeps memory flat on very large documents
+        for _, element in ElementTree.iterparse(f):
+            if element.tag == self.WORD_NS + 'p':
+                text = ''.join(
+                    (node.text or '') if node.tag == self.WORD_NS + 't' else '\t'
+                    for node in element.iter()
+                    if node.tag in (self.WORD_NS + 't', self.WORD_NS + 'tab')
+                )
+                paragraphs.append(text)
+                element.clear()
+        return '\n'.join(paragraphs)
+
+
+@register_extractor(*IMAGE_TYPES)
+class ImageExtractor:
+    def page_count(self, file_path):
+        return 1
+
+    def extract_pages(self, file_path, first, last, ocr):
+        return [ocr.file_to_text(file_path)]
+
+
+def run_extract_job(payload):
+    """Returns ``{'pages': [text, ...], 'ocr': OCR stats}`` for the payload's page range."""
+    ocr = OcrEngine(payload.get('ocr_settings'), payload.get('ocr_cache'))
+    extractor = get_extractor(payload['file_type'])
+    pages = extractor.extract_pages(payload['file_path'], payload['first_page'], payload['last_page'], ocr)
+    return {'pages': pages, 'ocr': ocr.stats()}
+
+
+def run_page_count_job(payload):
+    """Returns the payload file's page count; parsing a large PDF is too slow for an event loop."""
+    return get_extractor(payload['file_type']).page_count(payload['file_path'])
@@ -0,0 +1,32 @@
+"""File-system helpers shared by the modules that write keys and stored files."""
+import os
+
+
+def fsync_directory(directory):
+    # Makes renames and new files durable on POSIX; not supported on Windows
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def replace_durably(tmp_path, path):
+    """``os.replace`` whose data and rename both survive a power failure."""
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def create_key_file(key_file, new_key):
+    """Writes ``new_key()`` to ``key_file`` (mode 0600) unless the file already exists."""
+    if os.path.exists(key_file):
+        return
+    try:
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return  # created by another process in the meantime
+    with os.fdopen(fd, 'w') as f:
+        f.write(new_key() + '\n')
@@ -0,0 +1,262 @@
+"""Persistent background job queue.
+
+Jobs are rows in the ``job`` table, so queued work survives restarts. A single
+dispatcher thread claims queued jobs and runs them on a process pool; results
+are handed back to the ``on_complete`` callback in the dispatcher thread, which
+is where database updates happen.
+"""
+import json
+import multiprocessing
+import threading
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from sqlalchemy import (Column, DateTime, Float, Index, Integer, MetaData, String,
+                        Table, Text, inspect, select, text, update)
+
+from database import retry_on_busy
+
+metadata = MetaData()
+
+job_table = Table(
+    'job', metadata,
+    Column('id', String(36), primary_key=True),
+    Column('kind', String(50), nullable=False),
+    Column('document_id', String(36), nullable=True),
+    Column('payload', Text, nullable=False),
+    Column('status', String(20), nullable=False),  # queued, running, done, failed
+    Column('progress', Float, nullable=False, default=0.0),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('error', Text, nullable=True),
+    Column('stats', Text, nullable=True),  # JSON, e.g. per-stage OCR timings
+    Column('created_at', DateTime, default=datetime.utcnow),
+    Column('updated_at', DateTime, default=datetime.utcnow, onupdate=datetime.utcnow),
+    Index('ix_job_status_created', 'status', 'created_at'),
+    Index('ix_job_document', 'document_id'),
+)
+
+
+def job_to_dict(row):
+    return {
+        'id': row.id,
+        'kind': row.kind,
+        'document_id': row.document_id,
+        'status': row.status,
+        'progress': row.progress,
+        'attempts': row.attempts,
+        'error': row.error,
+        'stats': json.loads(row.stats) if row.stats else None,
+        'created_at': row.created_at.isoformat(),
+        'updated_at': row.updated_at.isoformat()
+    }
+
+
+def _run_job(run, payload):
+    # Library exceptions are not always picklable, and an unpicklable result
+    # breaks the whole process pool; re-raise as a plain RuntimeError.
+    try:
+        return run(payload)
+    except Exception as e:
+        raise RuntimeError(f'{type(e).__name__}: {e}') from None
+
+
+class JobQueue:
+    def __init__(self, engine, max_workers=2, max_attempts=3, poll_interval=1.0):
+        self.engine = engine
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self._wake = threading.Event()
+        self._stopping = False
+        self._inflight = {}
+        self._finished = []
+        self._lock = threading.Lock()
+        self._executor = None
+        self._thread = None
+
+    def init_schema(self):
+        metadata.create_all(self.engine)
+        # Columns added after the table was first created
+        existing = {col['name'] for col in inspect(self.engine).get_columns('job')}
+        with self.engine.begin() as conn:
+            for col in job_table.columns:
+                if col.name not in existing:
+                    conn.execute(text(f'ALTER TABLE job ADD COLUMN {col.name} {col.type.compile(self.engine.dialect)}'))
+
+    def register(self, kind, run, on_complete, on_failure=None):
+        """``run(payload)`` executes in a worker process and must be a module-level function."""
+        self.handlers[kind] = (run, on_complete, on_failure)
+
+    def enqueue(self, session, kind, payload, document_id=None):
+        """Add a job inside the caller's transaction; call ``notify()`` after commit."""
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        session.execute(job_table.insert().values(
+            id=job_id, kind=kind, document_id=document_id, payload=json.dumps(payload),
+            status='queued', progress=0.0, attempts=0, created_at=now, updated_at=now
+        ))
+        return job_id
+
+    def notify(self):
+        self._wake.set()
+
+    def get(self, job_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(job_table).where(job_table.c.id == job_id)).first()
+        return job_to_dict(row) if row else None
+
+    def for_document(self, document_id):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(job_table)
+                .where(job_table.c.document_id == document_id)
+                .order_by(job_table.c.created_at)
+            ).all()
+        return [job_to_dict(row) for row in rows]
+
+    def pending(self, document_ids, exclude=None):
+        """Kinds of queued or running jobs for any of ``document_ids``, other than job ``exclude``."""
+        if not document_ids:
+            return set()
+        query = select(job_table.c.kind).where(
+            job_table.c.document_id.in_(list(document_ids)),
+            job_table.c.status.in_(['queued', 'running'])
+        )
+        if exclude is not None:
+            query = query.where(job_table.c.id != exclude)
+        with self.engine.connect() as conn:
+            return set(conn.scalars(query))
+
+    @retry_on_busy
+    def set_progress(self, job_id, progress):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(job_table).where(job_table.c.id == job_id)
+                .values(progress=progress, updated_at=datetime.utcnow())
+            )
+
+    @retry_on_busy
+    def set_stats(self, job_id, stats):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(job_table).where(job_table.c.id == job_id)
+                .values(stats=json.dumps(stats), updated_at=datetime.utcnow())
+            )
+
+    def start(self):
+        # Worker processes re-import the app module; only the parent dispatches.
+        if multiprocessing.parent_process() is not None or self._thread is not None:
+            return
+        # Jobs that were running when the process died go back on the queue.
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(job_table)
+                .where(job_table.c.status == 'running')
+                .values(status='queued', updated_at=datetime.utcnow())
+            )
+        self._executor = self._make_executor()
+        self._thread = threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True)
+        self._thread.start()
+
+    def _make_executor(self):
+        if self.max_workers > 0:
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        # max_workers=0 runs jobs on a single background thread (no subprocesses).
+        return ThreadPoolExecutor(max_workers=1)
+
+    def shutdown(self, wait=True):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def _dispatch_loop(self):
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                self._handle_finished()
+                self._claim_and_submit()
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(self.poll_interval)
+        self._handle_finished()
+
+    def _claim_and_submit(self):
+        free = max(self.max_workers, 1) - len(self._inflight)
+        if free <= 0:
+            return
+        for row in self._claim(free):
+            run = self.handlers[row.kind][0]
+            try:
+                future = self._executor.submit(_run_job, run, json.loads(row.payload))
+            except BrokenProcessPool as e:
+                # A worker died; put the job back and replace the pool.
+                self._finish(row.id, status='queued', error=str(e))
+                self._executor = self._make_executor()
+                continue
+            self._inflight[row.id] = row
+            future.add_done_callback(lambda f, job_id=row.id: self._on_done(job_id, f))
+
+    @retry_on_busy
+    def _claim(self, limit):
+        with self.engine.begin() as conn:
+            candidates = conn.execute(
+                select(job_table)
+                .where(job_table.c.status == 'queued', job_table.c.kind.in_(list(self.handlers)))
+                .order_by(job_table.c.created_at)
+                .limit(limit)
+            ).all()
+            claimed = []
+            for row in candidates:
+                result = conn.execute(
+                    update(job_table)
+                    .where(job_table.c.id == row.id, job_table.c.status == 'queued')
+                    .values(status='running', attempts=row.attempts + 1, updated_at=datetime.utcnow())
+                )
+                if result.rowcount == 1:
+                    claimed.append(row)
+        return claimed
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            self._finished.append((job_id, future))
+        self._wake.set()
+
+    def _handle_finished(self):
+        with self._lock:
+            finished, self._finished = self._finished, []
+        for job_id, future in finished:
+            row = self._inflight.pop(job_id)
+            if future.cancelled():
+                # Cancelled on shutdown; the job stays 'running' and is requeued on restart.
+                continue
+            _, on_complete, on_failure = self.handlers[row.kind]
+            job = job_to_dict(row)
+            job['payload'] = json.loads(row.payload)
+            try:
+                on_complete(job, future.result())
+                self._finish(job_id, status='done', progress=1.0)
+            except Exception as e:
+                attempts = row.attempts + 1
+                if attempts < self.max_attempts:
+                    self._finish(job_id, status='queued', error=str(e))
+                else:
+                    if on_failure is not None:
+                        on_failure(job, e)
+                    self._finish(job_id, status='failed', error=str(e))
+
+    @retry_on_busy
+    def _finish(self, job_id, **values):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(job_table).where(job_table.c.id == job_id)
+                .values(updated_at=datetime.utcnow(), **values)
+            )
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query, Body, status
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query, Body, BackgroundTasks, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from typing import List, Optional, Dict, Any
@@ -10,10 +10,15 @@ import uuid
 from enum import Enum
 import os
 import shutil
-import pytesseract
-from PIL import Image
-import io
 import json
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import heapq
+from repository import IndexedTable
+from persistence import LogStore, MemoryStore
+from extractors import get_extractor, page_ranges, run_extract_job, run_page_count_job
 
 # Modelss
 class AccessLevel(str, Enum):
@@ -84,6 +89,7 @@ class Document(DocumentBase):
     updated_at: datetime
     owner_id: str
     content: Optional[str] = None
+    content_status: str = "ready"
     thumbnail: Optional[str] = None
 
     class Config:
@@ -131,12 +137,24 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# bcrypt takes ~200 ms per call; it runs on a bounded thread pool (bcrypt releases
+# the GIL) and at most PASSWORD_HASH_CONCURRENCY calls are in flight, so a login
+# storm queues up instead of stalling every other request on the event loop.
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get("PASSWORD_HASH_CONCURRENCY", os.cpu_count() or 2))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+password_slots = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+
+async def run_password_hashing(func, *args):
+    async with password_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, func, *args)
+
 # Helper functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await run_password_hashing(pwd_context.verify, plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await run_password_hashing(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -165,56 +183,151 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     
     # In a real app, you would fetch the user from a database
     # For this example, we'll use a mock user
+    await seed_default_users()
     user = get_user_by_id(token_data.user_id)
     if user is None:
         raise credentials_exception
     return user
 
 # Mock database (in a real app, you would use a proper database)
-users_db = {
-    "1": {
-        "id": "1",
-        "email": "admin@example.com",
-        "name": "Admin User",
-        "role": "admin",
-        "hashed_password": get_password_hash("admin123"),
-        "created_at": datetime.now()
-    },
-    "2": {
-        "id": "2",
-        "email": "user@example.com",
-        "name": "Regular User",
-        "role": "user",
-        "hashed_password": get_password_hash("user123"),
-        "created_at": datetime.now()
-    }
-}
-
-documents_db = {}
-workflows_db = {}
+users_db = IndexedTable(indexes=("email",))
+
+# Default users are hashed and added on first use rather than at import time
+DEFAULT_USERS = [
+    {"id": "1", "email": "admin@example.com", "name": "Admin User", "role": "admin", "password": "admin123"},
+    {"id": "2", "email": "user@example.com", "name": "Regular User", "role": "user", "password": "user123"},
+]
+default_users_seeded = False
+default_users_lock = asyncio.Lock()
+
+async def seed_default_users():
+    global default_users_seeded
+    if default_users_seeded:
+        return
+    async with default_users_lock:
+        if default_users_seeded:
+            return
+        # Users restored from disk are not hashed again
+        missing = [user for user in DEFAULT_USERS if user["id"] not in users_db]
+        hashes = await asyncio.gather(*(get_password_hash(user["password"]) for user in missing))
+        for user, hashed_password in zip(missing, hashes):
+            users_db.setdefault(user["id"], {
+                "id": user["id"],
+                "email": user["email"],
+                "name": user["name"],
+                "role": user["role"],
+                "hashed_password": hashed_password,
+                "created_at": datetime.now()
+            })
+        default_users_seeded = True
+
+# Secondary indexes turn list filters into set intersections instead of full scans
+documents_db = IndexedTable(indexes=("owner_id", "status", "type", "tags", "access_level", "encrypted"))
+workflows_db = IndexedTable(indexes=("status",))
+
+# Tables are kept in DMS_DATA_DIR as a write-ahead log plus compacted snapshots
+# (see persistence.py); DMS_STORAGE=memory keeps everything in memory only.
+DATA_DIR = os.environ.get("DMS_DATA_DIR", "data")
+if os.environ.get("DMS_STORAGE", "wal") == "memory":
+    store = MemoryStore()
+else:
+    store = LogStore(
+        DATA_DIR,
+        fsync_interval=float(os.environ.get("DMS_FSYNC_INTERVAL", "0.05")),
+        compact_after=int(os.environ.get("DMS_COMPACT_AFTER", "50000"))
+    )
+store.attach("users", users_db)
+store.attach("documents", documents_db)
+store.attach("workflows", workflows_db)
+
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Uploads waiting for text extraction; anything left here by a previous process is abandoned
+EXTRACTION_DIR = os.path.join(DATA_DIR, "extracting")
+os.makedirs(EXTRACTION_DIR, exist_ok=True)
+
+# Text extraction and OCR run in worker processes so they never block the event loop
+extract_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 2)
+
+async def run_extraction(doc_id: str, file_path: str, file_type: str):
+    loop = asyncio.get_running_loop()
+    pages = []
+    content_status = "ready"
+    try:
+        page_count = await loop.run_in_executor(extract_executor, run_page_count_job, {
+            "file_path": file_path,
+            "file_type": file_type
+        })
+        # Page ranges are extracted in parallel; content is updated as each one finishes
+        jobs = [
+            loop.run_in_executor(extract_executor, run_extract_job, {
+                "file_path": file_path,
+                "file_type": file_type,
+                "first_page": first_page,
+                "last_page": last_page
+            })
+            for first_page, last_page in page_ranges(page_count)
+        ]
+        for job in jobs:
+            pages.extend((await job)['pages'])
+            doc = documents_db.get(doc_id)
+            if doc is not None:
+                doc["content"] = "\n\n".join(pages)
+        content = "\n\n".join(pages)
+    except Exception as e:
+        content = f"Error extracting text: {str(e)}"
+        content_status = "failed"
+    finally:
+        os.remove(file_path)
+    doc = documents_db.get(doc_id)
+    if doc is not None:
+        doc["content"] = content
+        doc["content_status"] = content_status
+        # Assign back so the final text is persisted (the partial updates above are not)
+        documents_db[doc_id] = doc
+
+def fail_interrupted_extractions():
+    # Extraction does not survive a restart, so restored documents would otherwise stay pending forever
+    for doc_id, doc in list(documents_db.items()):
+        if doc.get("content_status") == "pending":
+            doc["content"] = "Error extracting text: interrupted by a restart"
+            doc["content_status"] = "failed"
+            documents_db[doc_id] = doc
+    shutil.rmtree(EXTRACTION_DIR, ignore_errors=True)
+    os.makedirs(EXTRACTION_DIR, exist_ok=True)
 
 # Mock database functions
+def accessible_document_ids(user):
+    # Own documents plus anything that is not private
+    shared_levels = [level for level in documents_db.values_of("access_level") if level != AccessLevel.private]
+    return documents_db.ids("owner_id", user["id"]) | documents_db.ids("access_level", *shared_levels)
+
 def get_user_by_email(email: str):
-    for user_id, user in users_db.items():
-        if user["email"] == email:
-            return user
-    return None
+    return users_db.first("email", email)
 
 def get_user_by_id(user_id: str):
     if user_id in users_db:
         return users_db[user_id]
     return None
 
-def authenticate_user(email: str, password: str):
+async def authenticate_user(email: str, password: str):
+    await seed_default_users()
     user = get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user["hashed_password"]):
+    if not await verify_password(password, user["hashed_password"]):
         return False
     return user
 
 # FastAPI app
-app = FastAPI(title="Intelligent DMS API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    store.open()
+    fail_interrupted_extractions()
+    yield
+    store.close()
+
+app = FastAPI(title="Intelligent DMS API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -228,7 +341,7 @@ app.add_middleware(
 # Authentication endpoints
 @app.post("/api/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -243,6 +356,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 @app.post("/api/register", response_model=User)
 async def register_user(user: UserCreate):
+    await seed_default_users()
     # Check if user already exists
     existing_user = get_user_by_email(user.email)
     if existing_user:
@@ -253,7 +367,13 @@ async def register_user(user: UserCreate):
     
     # Create new user
     user_id = str(uuid.uuid4())
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
+    # Another request may have registered the email while this one was hashing
+    if get_user_by_email(user.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     
     new_user = {
         "id": user_id,
@@ -282,6 +402,7 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 # Document endpoints
 @app.post("/api/documents", response_model=Document)
 async def create_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     tags: str = Form("[]"),
     access_level: AccessLevel = Form(AccessLevel.private),
@@ -294,24 +415,24 @@ async def create_document(
     # Generate unique ID
     doc_id = str(uuid.uuid4())
     
-    # Get file info
-    file_content = await file.read()
-    file_size = len(file_content)
+    # Get file info, streaming the upload to a temporary file instead of reading it into memory
     file_type = file.filename.split('.')[-1] if '.' in file.filename else ''
+    file_size = 0
+    with tempfile.NamedTemporaryFile(dir=EXTRACTION_DIR, delete=False) as tmp:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            tmp.write(chunk)
+            file_size += len(chunk)
     
     # Extract text content if possible (for searchability)
     content = None
-    if file_type.lower() in ['txt', 'pdf', 'doc', 'docx']:
-        # In a real app, you would use appropriate libraries for each file type
-        # For this example, we'll just use a placeholder
-        content = "Extracted text content would go here"
-    elif file_type.lower() in ['jpg', 'jpeg', 'png']:
-        # Use OCR for images
-        try:
-            image = Image.open(io.BytesIO(file_content))
-            content = pytesseract.image_to_string(image)
-        except Exception as e:
-            content = f"Error extracting text: {str(e)}"
+    content_status = "ready"
+    if get_extractor(file_type):
+        # Extract text (OCR for images and scanned pages) after the response has been sent
+        content_status = "pending"
+        background_tasks.add_task(run_extraction, doc_id, tmp.name, file_type)
+    
+    if content_status != "pending":
+        os.remove(tmp.name)
     
     # Create document record
     now = datetime.now()
@@ -326,6 +447,7 @@ async def create_document(
         "status": DocumentStatus.pending,
         "owner_id": current_user["id"],
         "content": content,
+        "content_status": content_status,
         "created_at": now,
         "updated_at": now
     }
@@ -346,34 +468,28 @@ async def get_documents(
     encrypted: Optional[bool] = None,
     current_user: User = Depends(get_current_user)
 ):
-    # Filter documents based on query parameters
-    results = []
-    
-    for doc_id, doc in documents_db.items():
-        # Check if user has access to the document
-        if doc["owner_id"] != current_user["id"] and doc["access_level"] == AccessLevel.private:
-            continue
-            
-        # Apply filters
-        if search and search.lower() not in doc["name"].lower() and (not doc["content"] or search.lower() not in doc["content"].lower()):
-            continue
-            
-        if tags and not any(tag in doc["tags"] for tag in tags):
-            continue
-            
-        if file_type and doc["type"] != file_type:
-            continue
-            
-        if access_level and doc["access_level"] != access_level:
-            continue
-            
-        if status and doc["status"] != status:
-            continue
-            
-        if encrypted is not None and doc["encrypted"] != encrypted:
-            continue
-            
-        results.append(doc)
+    # Filter documents based on query parameters, using the indexes
+    criteria = {}
+    if tags:
+        criteria["tags"] = tags
+    if file_type:
+        criteria["type"] = file_type
+    if access_level:
+        criteria["access_level"] = access_level
+    if status:
+        criteria["status"] = status
+    if encrypted is not None:
+        criteria["encrypted"] = encrypted
+    doc_ids = documents_db.where(**criteria) & accessible_document_ids(current_user)
+    results = documents_db.select(doc_ids)
+    
+    # Substring search is not indexed; it only runs over the already filtered documents
+    if search:
+        search = search.lower()
+        results = [
+            doc for doc in results
+            if search in doc["name"].lower() or (doc["content"] and search in doc["content"].lower())
+        ]
     
     return results
 
@@ -399,6 +515,27 @@ async def get_document(
         
     return doc
 
+@app.get("/api/documents/{document_id}/status")
+async def get_document_status(
+    document_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    if document_id not in documents_db:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+        
+    doc = documents_db[document_id]
+    
+    if doc["owner_id"] != current_user["id"] and doc["access_level"] == AccessLevel.private:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this document"
+        )
+        
+    return {"document_id": doc["id"], "content_status": doc["content_status"]}
+
 @app.put("/api/documents/{document_id}", response_model=Document)
 async def update_document(
     document_id: str,
@@ -601,16 +738,9 @@ async def get_workflows(
     current_user: User = Depends(get_current_user)
 ):
     # Filter workflows based on query parameters
-    results = []
-    
-    for workflow_id, workflow in workflows_db.items():
-        # Apply filters
-        if status and workflow["status"] != status:
-            continue
-            
-        results.append(workflow)
-    
-    return results
+    if status:
+        return workflows_db.select(workflows_db.ids("status", status))
+    return list(workflows_db.values())
 
 @app.get("/api/workflows/{workflow_id}", response_model=Workflow)
 async def get_workflow(
@@ -718,25 +848,17 @@ async def delete_workflow(
 # Dashboard endpoints
 @app.get("/api/dashboard/stats")
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
-    # Calculate statistics
+    # Calculate statistics from the index sizes
     total_documents = len(documents_db)
-    encrypted_documents = sum(1 for doc in documents_db.values() if doc["encrypted"])
-    shared_documents = sum(1 for doc in documents_db.values() if doc["access_level"] == AccessLevel.shared)
-    pending_documents = sum(1 for doc in documents_db.values() if doc["status"] == DocumentStatus.pending)
+    encrypted_documents = documents_db.counts("encrypted").get(True, 0)
+    shared_documents = documents_db.counts("access_level").get(AccessLevel.shared.value, 0)
+    pending_documents = documents_db.counts("status").get(DocumentStatus.pending.value, 0)
     
     # Get document counts by type
-    document_types = {}
-    for doc in documents_db.values():
-        doc_type = doc["type"]
-        if doc_type in document_types:
-            document_types[doc_type] += 1
-        else:
-            document_types[doc_type] = 1
+    document_types = documents_db.counts("type")
             
     # Get all unique tags
-    all_tags = set()
-    for doc in documents_db.values():
-        all_tags.update(doc["tags"])
+    all_tags = documents_db.values_of("tags")
     
     return {
         "total_documents": total_documents,
@@ -753,17 +875,10 @@ async def get_recent_documents(
     current_user: User = Depends(get_current_user)
 ):
     # Get documents accessible to the user
-    accessible_docs = [
-        doc for doc in documents_db.values()
-        if doc["owner_id"] == current_user["id"] or doc["access_level"] != AccessLevel.private
-    ]
+    accessible_docs = (documents_db[doc_id] for doc_id in accessible_document_ids(current_user))
     
-    # Sort by updated_at (most recent first) and limit results
-    recent_docs = sorted(
-        accessible_docs,
-        key=lambda x: x["updated_at"],
-        reverse=True
-    )[:limit]
+    # Most recently updated first; a heap avoids sorting every accessible document
+    recent_docs = heapq.nlargest(limit, accessible_docs, key=lambda x: x["updated_at"])
     
     return recent_docs
 
@@ -0,0 +1,213 @@
+"""Request metrics in the Prometheus text format, SQL statement tracking and
+a sampling profiler for slow requests.
+
+``Counter`` and ``Histogram`` are minimal labelled metrics; ``Registry.render()``
+produces the text exposition format (version 0.0.4) that Prometheus scrapes,
+so no client library is needed.
+
+``QueryTracker`` counts the statements an engine executes, and how long they
+take, for the request running on the current thread. ``SamplingProfiler``
+records the stack of selected threads every ``interval`` seconds from one
+background thread; ``write_collapsed`` saves the samples in the collapsed
+stack format read by flamegraph.pl and speedscope.
+"""
+import math
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+from sqlalchemy import event
+
+# Seconds; covers fast lookups up to slow uploads and exports
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', _format_labels(self.labels, key, [('le', _format_value(bound))]), cumulative
+            yield self.name + '_sum', _format_labels(self.labels, key), total
+            yield self.name + '_count', _format_labels(self.labels, key), count
+
+
+class Registry:
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class QueryTracker:
+    """Statement count and time for the request on the current thread.
+
+    Statements run by other threads (audit writer, job queue) are only
+    included in the totals passed to ``on_statement``.
+    """
+
+    def __init__(self, on_statement=None):
+        self.on_statement = on_statement
+        self._local = threading.local()
+
+    def attach(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._query_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._query_started
+            stats = getattr(self._local, 'stats', None)
+            if stats is not None:
+                stats[0] += 1
+                stats[1] += elapsed
+            if self.on_statement is not None:
+                self.on_statement(elapsed)
+
+    def begin(self):
+        self._local.stats = [0, 0.0]
+
+    def end(self):
+        """Return ``(statements, seconds)`` since ``begin()`` on this thread."""
+        stats = getattr(self._local, 'stats', None)
+        self._local.stats = None
+        return tuple(stats) if stats is not None else (0, 0.0)
+
+
+class SamplingProfiler:
+    """Samples the stacks of registered threads while they are registered."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._stacks[thread_id] = StackCounter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id=None):
+        """Stop sampling a thread; returns ``{collapsed stack: samples}``."""
+        with self._lock:
+            return self._stacks.pop(thread_id or threading.get_ident(), StackCounter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._stacks:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._stacks.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse(frame)] += 1
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def write_collapsed(path, stacks, header=()):
+    """Write samples as ``frame;frame;frame count`` lines, after ``# `` header lines."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in header:
+            f.write(f'# {line}\n')
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
@@ -0,0 +1,196 @@
+"""OCR helpers that run inside job worker processes.
+
+Images go through a small preprocessing pipeline before tesseract sees them:
+downsample to ``max_side`` (phone photos gain nothing from full resolution),
+convert to grayscale, binarize with Otsu's threshold and correct small skew.
+Results are cached on disk, keyed by the image hash and the OCR settings.
+"""
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import pytesseract
+from PIL import Image
+
+IMAGE_TYPES = ['jpg', 'jpeg', 'png']
+
+OCR_SETTINGS = {
+    'max_side': 2400,
+    'binarize': True,
+    'deskew': True,
+    'max_skew': 5.0,  # degrees searched either way
+    'lang': 'eng',
+    'config': '--psm 3',
+}
+# Bump when the preprocessing changes so cached results are not reused
+PIPELINE_VERSION = 1
+DESKEW_SAMPLE_SIDE = 800
+DESKEW_STEP = 0.5
+
+
+def otsu_threshold(image):
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(level * count for level, count in enumerate(histogram))
+    sum_below = weight_below = 0
+    best_level, best_variance = 128, -1.0
+    for level, count in enumerate(histogram):
+        weight_below += count
+        if weight_below == 0:
+            continue
+        weight_above = total - weight_below
+        if weight_above == 0:
+            break
+        sum_below += level * count
+        mean_below = sum_below / weight_below
+        mean_above = (sum_all - sum_below) / weight_above
+        variance = weight_below * weight_above * (mean_below - mean_above) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def binarize(image):
+    threshold = otsu_threshold(image)
+    return image.point(lambda value: 255 if value > threshold else 0)
+
+
+def skew_angle(image, max_skew):
+    """Estimate skew from the row projection profile of a small copy of ``image``.
+
+    Level text lines give sharp peaks in the per-row ink totals, so the best
+    angle is the one with the largest row-to-row differences.
+    """
+    sample = image.copy()
+    sample.thumbnail((DESKEW_SAMPLE_SIDE, DESKEW_SAMPLE_SIDE))
+    # Ink is white on black so the corners uncovered by rotation count as blank
+    sample = sample.point(lambda value: 255 - value)
+    best_angle, best_score = 0.0, -1
+    steps = int(max_skew / DESKEW_STEP)
+    for step in range(-steps, steps + 1):
+        angle = step * DESKEW_STEP
+        rotated = sample.rotate(angle, resample=Image.BILINEAR, fillcolor=0)
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        score = sum((below - above) ** 2 for above, below in zip(rows, rows[1:]))
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+class OcrEngine:
+    """Preprocess, recognize and cache; ``timings`` accumulates seconds per stage."""
+
+    def __init__(self, settings=None, cache_dir=None):
+        self.settings = {**OCR_SETTINGS, **(settings or {})}
+        self.cache_dir = cache_dir
+        self.timings = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        fingerprint = json.dumps([PIPELINE_VERSION, self.settings], sort_keys=True)
+        self._settings_key = hashlib.sha256(fingerprint.encode()).hexdigest()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'timings': {name: round(seconds, 4) for name, seconds in self.timings.items()},
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+    def file_to_text(self, file_path):
+        with self.stage('hash'):
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            image_hash = digest.hexdigest()
+        cached = self._cache_get(image_hash)
+        if cached is not None:
+            return cached
+        with self.stage('load'):
+            with Image.open(file_path) as image:
+                max_side = self.settings['max_side']
+                # JPEG can decode at 1/2, 1/4 or 1/8 scale, far cheaper than a full decode
+                image.draft('L', (max_side, max_side))
+                image = image.convert('L')
+        return self._recognize(image, image_hash)
+
+    def image_to_text(self, image, image_hash=None):
+        if image_hash is None:
+            with self.stage('hash'):
+                image_hash = hashlib.sha256(image.tobytes()).hexdigest()
+        cached = self._cache_get(image_hash)
+        if cached is not None:
+            return cached
+        return self._recognize(image, image_hash)
+
+    def preprocess(self, image):
+        with self.stage('downsample'):
+            if image.mode != 'L':
+                image = image.convert('L')
+            max_side = self.settings['max_side']
+            if max(image.size) > max_side:
+                image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if self.settings['binarize']:
+            with self.stage('binarize'):
+                image = binarize(image)
+        if self.settings['deskew']:
+            with self.stage('deskew'):
+                angle = skew_angle(image, self.settings['max_skew'])
+                if angle:
+                    image = image.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+        return image
+
+    def _recognize(self, image, image_hash):
+        image = self.preprocess(image)
+        with self.stage('recognize'):
+            text = pytesseract.image_to_string(
+                image, lang=self.settings['lang'], config=self.settings['config']
+            )
+        self._cache_put(image_hash, text)
+        return text
+
+    def _cache_path(self, image_hash):
+        key = hashlib.sha256(f'{image_hash}:{self._settings_key}'.encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f'{key}.txt')
+
+    def _cache_get(self, image_hash):
+        if not self.cache_dir:
+            return None
+        with self.stage('cache'):
+            try:
+                with open(self._cache_path(image_hash), encoding='utf-8') as f:
+                    text = f.read()
+            except FileNotFoundError:
+                self.cache_misses += 1
+                return None
+        self.cache_hits += 1
+        return text
+
+    def _cache_put(self, image_hash, text):
+        if not self.cache_dir:
+            return
+        with self.stage('cache'):
+            path = self._cache_path(image_hash)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+
+
+def image_to_text(file_path):
+    return OcrEngine().file_to_text(file_path)
+
+
+def run_ocr_job(payload):
+    return image_to_text(payload['file_path'])
@@ -0,0 +1,242 @@
+"""Persistence for the FastAPI app's in-memory tables.
+
+``LogStore`` keeps an append-only write-ahead log of every change to the
+attached ``IndexedTable``s plus periodic compacted snapshots, all as JSON lines
+in one directory:
+
+    snapshot-<gen>.jsonl   full state as of the start of wal-<gen>.jsonl
+    wal-<gen>.jsonl        changes made after that snapshot
+
+Startup loads the newest complete snapshot and replays the logs from that
+generation on. Every write is flushed to the OS immediately, so a crashed
+process loses nothing; ``fsync`` runs on a background thread at most every
+``fsync_interval`` seconds, so a power failure can lose at most that window.
+Once ``compact_after`` changes have been logged, the log is rotated and a new
+snapshot is written in the background, after which older files are removed.
+
+``MemoryStore`` has the same interface and keeps nothing.
+"""
+import glob
+import json
+import os
+import re
+import threading
+import traceback
+from datetime import date, datetime
+
+from fileutil import fsync_directory
+
+FILE_PATTERN = re.compile(r'(snapshot|wal)-(\d+)\.jsonl$')
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    raise TypeError(f'Cannot persist {type(value).__name__}')
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        if '$datetime' in obj:
+            return datetime.fromisoformat(obj['$datetime'])
+        if '$date' in obj:
+            return date.fromisoformat(obj['$date'])
+    return obj
+
+
+def dumps(entry):
+    return json.dumps(entry, default=_encode, separators=(',', ':'))
+
+
+def loads(line):
+    return json.loads(line, object_hook=_decode)
+
+
+class MemoryStore:
+    def attach(self, name, table):
+        pass
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LogStore:
+    def __init__(self, directory, fsync_interval=0.05, compact_after=50000):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.compact_after = compact_after
+        self.tables = {}
+        self.generation = 0
+        self._log = None
+        self._entries = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._syncer = None
+        self._compactor = None
+
+    def attach(self, name, table):
+        self.tables[name] = table
+
+    def _path(self, kind, generation):
+        return os.path.join(self.directory, f'{kind}-{generation}.jsonl')
+
+    def _generations(self, kind):
+        found = []
+        for path in glob.glob(os.path.join(self.directory, f'{kind}-*.jsonl')):
+            match = FILE_PATTERN.search(os.path.basename(path))
+            if match:
+                found.append(int(match.group(2)))
+        return sorted(found)
+
+    def open(self):
+        """Load the tables from disk and start logging their changes."""
+        if self._log is not None:
+            return
+        self._stopping.clear()
+        os.makedirs(self.directory, exist_ok=True)
+        snapshots = self._generations('snapshot')
+        start = snapshots[-1] if snapshots else 0
+        if snapshots:
+            self._load_snapshot(self._path('snapshot', start))
+        wals = [generation for generation in self._generations('wal') if generation >= start]
+        for generation in wals:
+            self._entries += self._replay(self._path('wal', generation))
+        self.generation = max(wals + [start])
+        self._log = open(self._path('wal', self.generation), 'a', encoding='utf-8')
+        for name, table in self.tables.items():
+            table.journal = self._journal_for(name)
+        self._syncer = threading.Thread(target=self._sync_loop, name='wal-fsync', daemon=True)
+        self._syncer.start()
+
+    def close(self):
+        """Write a final snapshot (so the next start has nothing to replay) and stop."""
+        if self._log is None:
+            return
+        for table in self.tables.values():
+            table.journal = None
+        self._stopping.set()
+        self._syncer.join()
+        # _compact clears the attribute when it finishes, so join a local reference
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self._log.close()
+            self._log = None
+        if self._entries:
+            self.generation += 1
+            self._write_snapshot(self.generation, self._copy_state())
+
+    def _load_snapshot(self, path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                entry = loads(line)
+                table = self.tables.get(entry['t'])
+                if table is not None:
+                    table.load(entry['id'], entry['r'])
+
+    def _replay(self, path):
+        count = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = loads(line)
+                except ValueError:
+                    # A torn final write from a crash; everything before it is intact
+                    break
+                count += 1
+                table = self.tables.get(entry['t'])
+                if table is None:
+                    continue
+                if entry['r'] is None:
+                    if entry['id'] in table:
+                        table.unload(entry['id'])
+                else:
+                    table.load(entry['id'], entry['r'])
+        return count
+
+    def _journal_for(self, name):
+        def journal(record_id, record):
+            self.append(name, record_id, record)
+        return journal
+
+    def append(self, table_name, record_id, record):
+        line = dumps({'t': table_name, 'id': record_id, 'r': record})
+        with self._lock:
+            self._log.write(line + '\n')
+            self._log.flush()
+            self._dirty = True
+            self._entries += 1
+            compact = self._entries >= self.compact_after and self._compactor is None
+        if compact:
+            self._start_compaction()
+
+    def _sync_loop(self):
+        while not self._stopping.wait(self.fsync_interval):
+            self._sync()
+        self._sync()
+
+    def _sync(self):
+        with self._lock:
+            if not self._dirty or self._log is None:
+                return
+            self._dirty = False
+            # A duplicate descriptor lets fsync run without holding up appends
+            fd = os.dup(self._log.fileno())
+        try:
+            # One fsync covers every write since the last pass (group commit)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _copy_state(self):
+        # Shallow copies, so later in-place edits do not leak into the snapshot
+        return {name: [(record_id, dict(record)) for record_id, record in table.items()]
+                for name, table in self.tables.items()}
+
+    def _start_compaction(self):
+        # Rotate now so the snapshot matches exactly what the old logs contain
+        state = self._copy_state()
+        with self._lock:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._log.close()
+            self.generation += 1
+            generation = self.generation
+            self._log = open(self._path('wal', generation), 'a', encoding='utf-8')
+            self._entries = 0
+        self._compactor = threading.Thread(
+            target=self._compact, args=(generation, state), name='wal-compact', daemon=True
+        )
+        self._compactor.start()
+
+    def _compact(self, generation, state):
+        try:
+            self._write_snapshot(generation, state)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._compactor = None
+
+    def _write_snapshot(self, generation, state):
+        path = self._path('snapshot', generation)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for name, records in state.items():
+                for record_id, record in records:
+                    f.write(dumps({'t': name, 'id': record_id, 'r': record}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_directory(self.directory)
+        # The snapshot now covers every older file
+        for kind in ('snapshot', 'wal'):
+            for older in self._generations(kind):
+                if older < generation:
+                    os.remove(self._path(kind, older))
@@ -0,0 +1,131 @@
+"""In-memory tables with secondary indexes for the FastAPI app.
+
+``IndexedTable`` behaves like the plain dicts it replaces (``table[id] = record``,
+``table[id]``, ``del table[id]``) but keeps a ``value -> set of ids`` index per
+indexed field, so filters become set lookups and intersections instead of a
+scan over every record. Fields holding lists (e.g. tags) index each element.
+
+Indexes are updated when a record is assigned, so code that mutates a record
+in place must assign it back (``table[id] = record``) if an indexed field
+changed. Not thread-safe; the FastAPI app only touches it from the event loop.
+
+If ``journal`` is set it is called as ``journal(id, record)`` after every
+assignment and ``journal(id, None)`` after every delete (see persistence.py);
+``load()`` adds records without journaling them.
+"""
+from collections.abc import MutableMapping
+from enum import Enum
+from itertools import count
+
+
+def index_key(value):
+    # str-based enums and their plain values must land in the same bucket
+    return value.value if isinstance(value, Enum) else value
+
+
+def index_keys(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return {index_key(item) for item in value}
+    return {index_key(value)}
+
+
+class IndexedTable(MutableMapping):
+    def __init__(self, indexes=()):
+        self._records = {}
+        self._indexes = {field: {} for field in indexes}
+        # Indexed values as of the last assignment, used to unindex on change
+        self._indexed = {}
+        # Insertion order, so query results come back in the same order as a dict scan
+        self._order = {}
+        self._counter = count()
+        self.journal = None
+
+    def __getitem__(self, record_id):
+        return self._records[record_id]
+
+    def __setitem__(self, record_id, record):
+        self.load(record_id, record)
+        if self.journal is not None:
+            self.journal(record_id, record)
+
+    def __delitem__(self, record_id):
+        self.unload(record_id)
+        if self.journal is not None:
+            self.journal(record_id, None)
+
+    def load(self, record_id, record):
+        if record_id in self._records:
+            self._unindex(record_id)
+        else:
+            self._order[record_id] = next(self._counter)
+        self._records[record_id] = record
+        indexed = {field: index_keys(record.get(field)) for field in self._indexes}
+        for field, keys in indexed.items():
+            index = self._indexes[field]
+            for key in keys:
+                index.setdefault(key, set()).add(record_id)
+        self._indexed[record_id] = indexed
+
+    def unload(self, record_id):
+        del self._records[record_id]
+        self._unindex(record_id)
+        del self._indexed[record_id]
+        del self._order[record_id]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, record_id):
+        return record_id in self._records
+
+    def _unindex(self, record_id):
+        for field, keys in self._indexed[record_id].items():
+            index = self._indexes[field]
+            for key in keys:
+                ids = index[key]
+                ids.discard(record_id)
+                if not ids:
+                    del index[key]
+
+    def ids(self, field, *values):
+        """Ids of records whose ``field`` equals (or, for lists, contains) any of ``values``."""
+        index = self._indexes[field]
+        if len(values) == 1:
+            return set(index.get(index_key(values[0]), ()))
+        result = set()
+        for value in values:
+            result.update(index.get(index_key(value), ()))
+        return result
+
+    def values_of(self, field):
+        """Distinct values currently present in an indexed field."""
+        return list(self._indexes[field])
+
+    def counts(self, field):
+        """``{value: number of records}`` for an indexed field."""
+        return {key: len(ids) for key, ids in self._indexes[field].items()}
+
+    def first(self, field, value):
+        """One record whose ``field`` matches ``value``, or None (for unique fields like email)."""
+        ids = self._indexes[field].get(index_key(value))
+        if not ids:
+            return None
+        return self._records[min(ids, key=self._order.__getitem__)]
+
+    def select(self, ids):
+        """Records for ``ids`` in insertion order."""
+        return [self._records[record_id] for record_id in sorted(ids, key=self._order.__getitem__)]
+
+    def where(self, **criteria):
+        """Ids matching every ``field=value`` criterion; a list value matches any of its items."""
+        sets = []
+        for field, value in criteria.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            sets.append(self.ids(field, *values))
+        if not sets:
+            return set(self._records)
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
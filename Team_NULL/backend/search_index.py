@@ -0,0 +1,108 @@
+"""Full-text search index for documents backed by SQLite FTS5.
+
+The index lives next to the ``document`` table and is kept in sync by
+triggers, so every insert/update/delete (including bulk SQL statements)
+updates it inside the same transaction.
+"""
+import re
+
+from sqlalchemy import column, func, literal_column, table, text
+from sqlalchemy.exc import OperationalError
+
+FTS_TABLE = 'document_fts'
+
+document_fts = table(FTS_TABLE, column('rowid'), column('rank'))
+document_fts_map = table('document_fts_map', column('document_id'), column('fts_rowid'))
+
+# Name matches weigh more than matches in the OCR'd body text.
+NAME_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+SNIPPET_TOKENS = 12
+
+_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+        USING fts5(name, content, tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TABLE IF NOT EXISTS document_fts_map (
+        document_id VARCHAR(36) PRIMARY KEY,
+        fts_rowid INTEGER NOT NULL UNIQUE
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_fts_ai AFTER INSERT ON document BEGIN
+        INSERT INTO {FTS_TABLE}(name, content) VALUES (new.name, coalesce(new.content, ''));
+        INSERT INTO document_fts_map(document_id, fts_rowid) VALUES (new.id, last_insert_rowid());
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_fts_au AFTER UPDATE OF name, content ON document BEGIN
+        UPDATE {FTS_TABLE} SET name = new.name, content = coalesce(new.content, '')
+        WHERE rowid = (SELECT fts_rowid FROM document_fts_map WHERE document_id = old.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_fts_ad AFTER DELETE ON document BEGIN
+        DELETE FROM {FTS_TABLE}
+        WHERE rowid = (SELECT fts_rowid FROM document_fts_map WHERE document_id = old.id);
+        DELETE FROM document_fts_map WHERE document_id = old.id;
+    END""",
+]
+
+_TOKEN_RE = re.compile(r'(\w+)(\*?)', re.UNICODE)
+
+
+def init_search_index(engine):
+    """Create the FTS table and sync triggers; returns False if FTS5 is unavailable."""
+    if engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with engine.begin() as conn:
+            for statement in _SCHEMA:
+                conn.execute(text(statement))
+            indexed = conn.execute(text('SELECT count(*) FROM document_fts_map')).scalar()
+            total = conn.execute(text('SELECT count(*) FROM document')).scalar()
+            if indexed != total:
+                _rebuild(conn)
+    except OperationalError:
+        return False
+    return True
+
+
+def _rebuild(conn):
+    # Used when the index is created for an existing database (or drifted).
+    conn.execute(text(f'DELETE FROM {FTS_TABLE}'))
+    conn.execute(text('DELETE FROM document_fts_map'))
+    rows = conn.execute(text('SELECT id, name, content FROM document')).fetchall()
+    for document_id, name, content in rows:
+        fts_rowid = conn.execute(
+            text(f'INSERT INTO {FTS_TABLE}(name, content) VALUES (:name, :content)'),
+            {'name': name, 'content': content or ''}
+        ).lastrowid
+        conn.execute(
+            text('INSERT INTO document_fts_map(document_id, fts_rowid) VALUES (:id, :rowid)'),
+            {'id': document_id, 'rowid': fts_rowid}
+        )
+
+
+def build_match_query(search):
+    """Turn free text into an FTS5 query.
+
+    Every term must match (implicit AND). Terms ending in ``*`` and the last
+    term are treated as prefixes so search-as-you-type works.
+    """
+    terms = _TOKEN_RE.findall(search or '')
+    if not terms:
+        return None
+    parts = []
+    for i, (term, star) in enumerate(terms):
+        prefix = star or i == len(terms) - 1
+        parts.append(f'"{term}"' + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+
+def apply_search(query, model, match_query):
+    """Restrict ``query`` to FTS matches, ranked best first, with a snippet column."""
+    fts = literal_column(FTS_TABLE)
+    snippet = func.snippet(fts, -1, '<mark>', '</mark>', '…', SNIPPET_TOKENS).label('snippet')
+    return (
+        query
+        .join(document_fts_map, document_fts_map.c.document_id == model.id)
+        .join(document_fts, document_fts.c.rowid == document_fts_map.c.fts_rowid)
+        .filter(fts.match(match_query))
+        .add_columns(snippet)
+        .order_by(func.bm25(fts, NAME_WEIGHT, CONTENT_WEIGHT))
+    )
@@ -0,0 +1,106 @@
+"""Content-addressed file storage.
+
+Files are stored once per SHA-256 digest under ``<root>/<aa>/<bb>/<digest>``,
+or ``<digest>.enc`` once encrypted at rest (see encryption.py).
+Reference counts live in the database (see ``Blob`` in app.py); this module
+only deals with the files themselves.
+"""
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def iter_stream(stream, chunk_size=CHUNK_SIZE):
+    return iter(lambda: stream.read(chunk_size), b'')
+
+
+def iter_file(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        yield from iter_stream(f, chunk_size)
+
+
+def sha256_file(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    for chunk in iter_file(path, chunk_size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_chunks(chunks, path):
+    """Write chunks to ``path``; returns ``(sha256 hex digest, size)``."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def encrypted_path_for(self, digest):
+        # The encrypted form of a blob (see encryption.py) sits next to where the plaintext would be
+        return self.path_for(digest) + '.enc'
+
+    def exists(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def put_stream(self, stream):
+        """Store a file-like object; returns ``(digest, size)``."""
+        return self.put_chunks(iter_stream(stream))
+
+    def put_chunks(self, chunks):
+        """Store an iterable of byte chunks; returns ``(digest, size)``.
+
+        The data is hashed while it is written to a temporary file, which is
+        then moved into place (or dropped if the blob already exists).
+        """
+        tmp_path, digest, size = self.stage_chunks(chunks)
+        return self.put_file(tmp_path, digest), size
+
+    def stage_stream(self, stream):
+        return self.stage_chunks(iter_stream(stream))
+
+    def stage_chunks(self, chunks):
+        """Write chunks to a temporary file in the store; returns ``(tmp_path, digest, size)``.
+
+        Callers that count references move the file in with ``put_file`` only
+        after taking the reference, so a concurrent removal of the last one
+        cannot delete the file they rely on.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        os.close(fd)
+        try:
+            digest, size = write_chunks(chunks, tmp_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest, size
+
+    def put_file(self, tmp_path, digest):
+        """Move an already hashed temporary file into the store; returns the digest."""
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return digest
+
+    def remove(self, digest):
+        for path in (self.path_for(digest), self.encrypted_path_for(digest)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
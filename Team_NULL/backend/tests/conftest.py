@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    # app.py creates its database, uploads and keys relative to the working directory on import
+    workdir = tmp_path_factory.mktemp('dms')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{workdir / 'dms.db'}"
+    os.environ['AUDIT_SYNC'] = '1'
+    import app
+    yield app
+    app.job_queue.shutdown()
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def admin_headers(client):
+    response = client.post('/api/token', json={'username': 'admin@example.com', 'password': 'admin123'})
+    return {'Authorization': f"Bearer {response.json['access_token']}"}
@@ -0,0 +1,18 @@
+import sqlalchemy as sa
+
+from audit import AuditWriter
+
+
+def test_sync_write_failure_keeps_the_event_for_the_next_flush():
+    engine = sa.create_engine('sqlite://', poolclass=sa.pool.StaticPool)
+    metadata = sa.MetaData()
+    table = sa.Table('audit_trail', metadata, sa.Column('id', sa.String, primary_key=True))
+    writer = AuditWriter(engine, table, sync=True)
+
+    # The table does not exist yet, so the insert fails; log() must not raise
+    writer.log({'id': 'first'})
+
+    metadata.create_all(engine)
+    writer.log({'id': 'second'})
+    with engine.connect() as conn:
+        assert sorted(conn.execute(sa.select(table.c.id)).scalars()) == ['first', 'second']
@@ -0,0 +1,136 @@
+import io
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def add_legacy_document(m, data):
+    """A document stored before deduplication: its own file under uploads/, no content_hash."""
+    document_id = str(uuid.uuid4())
+    path = os.path.join(m.app.config['UPLOAD_FOLDER'], f'{uuid.uuid4()}.txt')
+    with open(path, 'wb') as f:
+        f.write(data)
+    with m.app.app_context():
+        admin = m.User.query.filter_by(email='admin@example.com').one()
+        m.db.session.add(m.Document(
+            id=document_id, name='legacy.txt', type='txt', size=len(data), access_level='private',
+            status='draft', owner_id=admin.id, content='', file_path=path
+        ))
+        m.db.session.commit()
+    return document_id, path
+
+
+def wait_for(predicate, timeout=15):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.1)
+
+
+def test_deleting_legacy_document_keeps_shared_blob(app_module, client, admin_headers):
+    m = app_module
+    data = b'identical bytes ' + uuid.uuid4().bytes
+    legacy_id, legacy_path = add_legacy_document(m, data)
+    uploaded = client.post(
+        '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+        data={'file': (io.BytesIO(data), 'new.txt')}
+    ).json
+
+    # Downloading fills in the legacy document's content_hash, which now names the shared blob
+    assert client.get(f'/api/documents/{legacy_id}/download', headers=admin_headers).data == data
+    assert client.delete(f'/api/documents/{legacy_id}', headers=admin_headers).status_code == 204
+
+    with m.app.app_context():
+        blob = m.db.session.get(m.Blob, m.Document.query.get(uploaded['id']).content_hash)
+        assert blob.ref_count == 1
+        assert os.path.exists(m.blob_store.path_for(blob.hash))
+    assert not os.path.exists(legacy_path)
+    assert client.get(f"/api/documents/{uploaded['id']}/download", headers=admin_headers).data == data
+
+
+def test_bulk_deleting_legacy_document_keeps_shared_blob(app_module, client, admin_headers):
+    m = app_module
+    data = b'identical bytes ' + uuid.uuid4().bytes
+    legacy_id, legacy_path = add_legacy_document(m, data)
+    uploaded = client.post(
+        '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+        data={'file': (io.BytesIO(data), 'new.txt')}
+    ).json
+
+    assert client.get(f'/api/documents/{legacy_id}/download', headers=admin_headers).data == data
+    response = client.post('/api/documents/bulk', headers=admin_headers, json={'action': 'delete', 'ids': [legacy_id]})
+    assert response.status_code == 200
+
+    with m.app.app_context():
+        blob = m.db.session.get(m.Blob, m.Document.query.get(uploaded['id']).content_hash)
+        assert blob.ref_count == 1
+        assert os.path.exists(m.blob_store.path_for(blob.hash))
+    assert not os.path.exists(legacy_path)
+    assert client.get(f"/api/documents/{uploaded['id']}/download", headers=admin_headers).data == data
+
+
+def test_encrypting_legacy_document_moves_it_into_blob_store(app_module, client, admin_headers):
+    m = app_module
+    data = b'legacy secret ' + uuid.uuid4().bytes
+    document_id, legacy_path = add_legacy_document(m, data)
+
+    assert client.post(f'/api/documents/{document_id}/encrypt', headers=admin_headers).status_code == 200
+    wait_for(lambda: client.get(f'/api/documents/{document_id}/status', headers=admin_headers).json['encrypted_at_rest'])
+
+    with m.app.app_context():
+        document = m.db.session.get(m.Document, document_id)
+        assert m.uses_blob(document)
+        assert m.db.session.get(m.Blob, document.content_hash).ref_count == 1
+        wait_for(lambda: not os.path.exists(document.file_path))
+        assert os.path.exists(m.blob_store.encrypted_path_for(document.content_hash))
+    assert not os.path.exists(legacy_path)
+    assert client.get(f'/api/documents/{document_id}/download', headers=admin_headers).data == data
+
+
+def test_concurrent_uploads_of_new_content_share_one_blob(app_module, admin_headers):
+    m = app_module
+    data = b'uploaded at once ' + uuid.uuid4().bytes
+
+    def upload(n):
+        return m.app.test_client().post(
+            '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+            data={'file': (io.BytesIO(data), f'copy-{n}.txt')}
+        ).status_code
+
+    with ThreadPoolExecutor(6) as pool:
+        assert list(pool.map(upload, range(6))) == [200] * 6
+    with m.app.app_context():
+        digest = m.Document.query.filter_by(name='copy-0.txt').one().content_hash
+        assert m.db.session.get(m.Blob, digest).ref_count == 6
+
+
+def test_upload_survives_removal_of_the_last_other_reference(app_module, client, admin_headers, monkeypatch):
+    m = app_module
+    data = b'deleted while uploading ' + uuid.uuid4().bytes
+    old = client.post(
+        '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+        data={'file': (io.BytesIO(data), 'old.txt')}
+    ).json
+    put_file = m.blob_store.put_file
+    deletes = ThreadPoolExecutor(1)
+
+    def put_then_delete_old(tmp_path, digest):
+        # The upload finds the blob in place, then its last other reference goes away
+        digest = put_file(tmp_path, digest)
+        deleted = deletes.submit(lambda: m.app.test_client().delete(f"/api/documents/{old['id']}", headers=admin_headers))
+        time.sleep(0.5)  # the delete runs now unless it has to wait for the upload's transaction
+        put_then_delete_old.deleted = deleted
+        return digest
+
+    monkeypatch.setattr(m.blob_store, 'put_file', put_then_delete_old)
+    new = client.post(
+        '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+        data={'file': (io.BytesIO(data), 'new.txt')}
+    ).json
+    assert put_then_delete_old.deleted.result().status_code == 204
+    deletes.shutdown()
+
+    assert client.get(f"/api/documents/{new['id']}/download", headers=admin_headers).data == data
+    with m.app.app_context():
+        assert m.db.session.get(m.Blob, m.db.session.get(m.Document, new['id']).content_hash).ref_count == 1
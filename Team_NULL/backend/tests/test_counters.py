@@ -0,0 +1,61 @@
+import io
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+THREADS = 6
+
+
+def run_concurrently(app_module, request):
+    # One test client per thread, like separate connections to a threaded server
+    with ThreadPoolExecutor(THREADS) as pool:
+        return list(pool.map(lambda n: request(app_module.app.test_client(), n), range(THREADS)))
+
+
+def test_concurrent_uploads_of_a_new_type(app_module, admin_headers):
+    m = app_module
+    file_type = f'new{uuid.uuid4().hex[:8]}'
+
+    def upload(client, n):
+        return client.post(
+            '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+            data={'file': (io.BytesIO(f'{file_type} {n}'.encode()), f'file-{n}.{file_type}')}
+        ).status_code
+
+    assert run_concurrently(m, upload) == [200] * THREADS
+    with m.app.app_context():
+        assert m.db.session.get(m.DocumentCounter, f'type:{file_type}').count == THREADS
+
+
+
+def upload_text(client, headers, text):
+    return client.post(
+        '/api/documents', headers=headers, content_type='multipart/form-data',
+        data={'file': (io.BytesIO(text.encode()), 'tagged.txt')}
+    ).json['id']
+
+
+def test_concurrent_first_use_of_a_tag(app_module, client, admin_headers):
+    m = app_module
+    tag = f'tag-{uuid.uuid4().hex[:8]}'
+    document_ids = [upload_text(client, admin_headers, f'tagged {tag} {n}') for n in range(THREADS)]
+
+    def add_tag(client, n):
+        return client.put(f'/api/documents/{document_ids[n]}', headers=admin_headers, json={'tags': [tag]}).status_code
+
+    assert run_concurrently(m, add_tag) == [200] * THREADS
+    with m.app.app_context():
+        assert m.db.session.get(m.TagCount, tag).count == THREADS
+
+
+def test_concurrent_tagging_of_one_document(app_module, client, admin_headers):
+    m = app_module
+    tag = f'tag-{uuid.uuid4().hex[:8]}'
+    document_id = upload_text(client, admin_headers, f'tagged once {tag}')
+
+    def add_tag(client, n):
+        return client.put(f'/api/documents/{document_id}', headers=admin_headers, json={'tags': [tag]}).status_code
+
+    assert run_concurrently(m, add_tag) == [200] * THREADS
+    with m.app.app_context():
+        assert m.db.session.get(m.TagCount, tag).count == 1
+        assert m.DocumentTag.query.filter_by(tag=tag).count() == 1
@@ -0,0 +1,34 @@
+import io
+import uuid
+
+from test_blob_references import add_legacy_document
+
+
+def count_downloads(m, document_id):
+    with m.app.app_context():
+        return m.AuditTrail.query.filter_by(document_id=document_id, action='download').count()
+
+
+def fetch_in_ranges(client, headers, url, size):
+    full = client.get(url, headers=headers)
+    assert full.status_code == 200
+    etag = full.headers['ETag']
+    for start in range(0, size, 4):
+        part = client.get(url, headers={**headers, 'Range': f'bytes={start}-{start + 3}'})
+        assert part.status_code == 206
+    assert client.get(url, headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+
+def test_ranges_and_revalidation_audit_one_download_each(app_module, client, admin_headers):
+    m = app_module
+    data = b'ranged bytes ' + uuid.uuid4().bytes
+    uploaded = client.post(
+        '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+        data={'file': (io.BytesIO(data), 'ranged.txt')}
+    ).json
+    legacy_id, _ = add_legacy_document(m, b'legacy ranged bytes ' + uuid.uuid4().bytes)
+
+    for document_id, size in ((uploaded['id'], len(data)), (legacy_id, 36)):
+        fetch_in_ranges(client, admin_headers, f'/api/documents/{document_id}/download', size)
+        # The full response and the first range
+        assert count_downloads(m, document_id) == 2
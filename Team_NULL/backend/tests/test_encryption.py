@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from encryption import HEADER, KEY_SIZE, TAG_SIZE, EncryptedFile, EncryptionError, decrypt_file, encrypt_file
+
+CHUNK = 64
+
+
+@pytest.fixture
+def master_key():
+    return os.urandom(KEY_SIZE)
+
+
+def encrypt(tmp_path, master_key, data):
+    plain = tmp_path / 'plain'
+    plain.write_bytes(data)
+    sealed = tmp_path / 'sealed'
+    assert encrypt_file(plain, sealed, master_key, chunk_size=CHUNK) == len(data)
+    return sealed
+
+
+@pytest.mark.parametrize('length', [0, CHUNK, CHUNK + 1, 3 * CHUNK + 5])
+def test_round_trip(tmp_path, master_key, length):
+    data = os.urandom(length)
+    sealed = encrypt(tmp_path, master_key, data)
+    restored = tmp_path / 'restored'
+    assert decrypt_file(sealed, restored, master_key) == length
+    assert restored.read_bytes() == data
+
+
+def test_range_reads_across_chunk_boundaries(tmp_path, master_key):
+    data = os.urandom(3 * CHUNK + 5)
+    with EncryptedFile(encrypt(tmp_path, master_key, data), master_key) as source:
+        assert source.size == len(data)
+        for start, stop in [(0, 1), (CHUNK - 1, CHUNK + 1), (CHUNK, 2 * CHUNK), (10, 3 * CHUNK + 2), (3 * CHUNK, len(data) + 100)]:
+            assert b''.join(source.iter_range(start, stop)) == data[start:stop]
+        assert b''.join(source.iter_range(len(data), len(data) + 10)) == b''
+
+
+def read_all(path, master_key):
+    with EncryptedFile(path, master_key) as source:
+        return b''.join(source.iter_range())
+
+
+def test_truncated_final_chunk_fails(tmp_path, master_key):
+    sealed = encrypt(tmp_path, master_key, os.urandom(2 * CHUNK + 10))
+    body = sealed.read_bytes()
+    sealed.write_bytes(body[:-5])
+    with pytest.raises(EncryptionError):
+        read_all(sealed, master_key)
+
+
+def test_dropping_the_final_chunk_fails(tmp_path, master_key):
+    sealed = encrypt(tmp_path, master_key, os.urandom(2 * CHUNK + 10))
+    body = sealed.read_bytes()
+    sealed.write_bytes(body[:HEADER.size + 2 * (CHUNK + TAG_SIZE)])
+    with pytest.raises(EncryptionError):
+        read_all(sealed, master_key)
+
+
+def test_reordered_chunks_fail(tmp_path, master_key):
+    sealed = encrypt(tmp_path, master_key, os.urandom(3 * CHUNK))
+    body = sealed.read_bytes()
+    header, sealed_chunk = body[:HEADER.size], CHUNK + TAG_SIZE
+    chunks = [body[HEADER.size + i * sealed_chunk:HEADER.size + (i + 1) * sealed_chunk] for i in range(3)]
+    sealed.write_bytes(header + chunks[1] + chunks[0] + chunks[2])
+    with pytest.raises(EncryptionError):
+        read_all(sealed, master_key)
+
+
+def test_wrong_master_key_is_rejected(tmp_path, master_key):
+    sealed = encrypt(tmp_path, master_key, b'secret')
+    with pytest.raises(EncryptionError):
+        EncryptedFile(sealed, os.urandom(KEY_SIZE))
@@ -0,0 +1,29 @@
+import io
+import time
+
+import fitz
+
+
+def make_pdf(page_count):
+    pdf = fitz.open()
+    for number in range(1, page_count + 1):
+        pdf.new_page().insert_text((72, 72), f'page marker {number:03d}')
+    return pdf.tobytes()
+
+
+def test_pdf_content_is_assembled_in_page_order(app_module, client, admin_headers):
+    m = app_module
+    document = client.post(
+        '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+        data={'file': (io.BytesIO(make_pdf(20)), 'long.pdf')}
+    ).json
+
+    deadline = time.monotonic() + 60
+    while client.get(f"/api/documents/{document['id']}/status", headers=admin_headers).json['content_status'] == 'pending':
+        assert time.monotonic() < deadline, 'extraction did not finish'
+        time.sleep(0.1)
+
+    with m.app.app_context():
+        content = m.db.session.get(m.Document, document['id']).content
+    positions = [content.index(f'page marker {number:03d}') for number in range(1, 21)]
+    assert positions == sorted(positions)
@@ -0,0 +1,136 @@
+import base64
+import io
+import json
+
+import pytest
+
+
+def cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+BAD_KEYSET_CURSORS = [
+    'not base64!',
+    cursor(['a list']),
+    cursor({'updated_at': 'yesterday', 'id': 'x'}),
+    cursor({'updated_at': '2020-01-01'}),
+    cursor({'timestamp': '2020-01-01'}),
+    cursor({'updated_at': '2020-01-01', 'id': 5}),
+]
+
+
+@pytest.mark.parametrize('bad_cursor', BAD_KEYSET_CURSORS)
+def test_document_listing_rejects_bad_cursor(client, admin_headers, bad_cursor):
+    response = client.get('/api/documents', headers=admin_headers, query_string={'limit': 2, 'cursor': bad_cursor})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('bad_cursor', [cursor({'offset': 'ten'}), cursor({'offset': -1}), cursor({})])
+def test_document_search_rejects_bad_cursor(client, admin_headers, bad_cursor):
+    response = client.get('/api/documents', headers=admin_headers, query_string={'search': 'x', 'cursor': bad_cursor})
+    assert response.status_code == 400
+
+
+def test_document_listing_pages_through_every_document(client, admin_headers):
+    for number in range(5):
+        client.post(
+            '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+            data={'file': (io.BytesIO(f'paged document {number}'.encode()), f'paged-{number}.txt')}
+        )
+    expected = [document['id'] for document in client.get('/api/documents', headers=admin_headers, query_string={'limit': 500}).json]
+
+    seen = []
+    query = {'limit': 2}
+    while True:
+        response = client.get('/api/documents', headers=admin_headers, query_string=query)
+        assert response.status_code == 200
+        seen.extend(document['id'] for document in response.json)
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        query['cursor'] = response.headers['X-Next-Cursor']
+    assert len(seen) >= 4
+    assert seen == expected
+
+
+
+def test_document_listing_defaults_to_one_page(app_module, client, admin_headers, monkeypatch):
+    for number in range(3):
+        client.post(
+            '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+            data={'file': (io.BytesIO(f'default page {number}'.encode()), f'default-{number}.txt')}
+        )
+    monkeypatch.setattr(app_module, 'DEFAULT_PAGE_SIZE', 2)
+
+    response = client.get('/api/documents', headers=admin_headers)
+    assert len(response.json) == 2
+    assert 'X-Next-Cursor' in response.headers
+
+@pytest.mark.parametrize('bad_cursor', [
+    'not base64!',
+    cursor({'timestamp': '2020-01-01'}),
+    cursor({'timestamp': 'noon', 'id': 'x'}),
+    cursor({'updated_at': '2020-01-01', 'id': 'x'}),
+])
+def test_audit_trail_rejects_bad_cursor(client, admin_headers, bad_cursor):
+    response = client.get('/api/audit/trail', headers=admin_headers, query_string={'cursor': bad_cursor})
+    assert response.status_code == 400
+
+
+def test_audit_trail_pages_through_every_event(client, admin_headers):
+    for number in range(4):
+        client.post(
+            '/api/documents', headers=admin_headers, content_type='multipart/form-data',
+            data={'file': (io.BytesIO(f'audited document {number}'.encode()), f'audited-{number}.txt')}
+        )
+    expected = [event['id'] for event in client.get('/api/audit/trail', headers=admin_headers, query_string={'limit': 500}).json]
+
+    seen = []
+    query = {'limit': 3}
+    while True:
+        response = client.get('/api/audit/trail', headers=admin_headers, query_string=query)
+        assert response.status_code == 200
+        seen.extend(event['id'] for event in response.json)
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        query['cursor'] = response.headers['X-Next-Cursor']
+    assert len(seen) >= 4
+    assert seen == expected
+
+
+@pytest.mark.parametrize('bad_cursor', BAD_KEYSET_CURSORS)
+def test_workflow_listing_rejects_bad_cursor(client, admin_headers, bad_cursor):
+    response = client.get('/api/workflows', headers=admin_headers, query_string={'limit': 2, 'cursor': bad_cursor})
+    assert response.status_code == 400
+
+
+def test_workflow_listing_pages_through_every_workflow(client, admin_headers):
+    for number in range(5):
+        client.post('/api/workflows', headers=admin_headers, json={
+            'name': f'Workflow {number}', 'description': 'Paged', 'status': 'active'
+        })
+    expected = [workflow['id'] for workflow in client.get('/api/workflows', headers=admin_headers).json]
+
+    seen = []
+    query = {'limit': 2}
+    while True:
+        response = client.get('/api/workflows', headers=admin_headers, query_string=query)
+        assert response.status_code == 200
+        seen.extend(workflow['id'] for workflow in response.json)
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        query['cursor'] = response.headers['X-Next-Cursor']
+    assert len(seen) >= 5
+    assert seen == expected
+
+
+def test_step_update_moves_workflow_to_the_top(client, admin_headers):
+    first = client.post('/api/workflows', headers=admin_headers, json={
+        'name': 'Stepped', 'description': 'Edited later', 'status': 'active',
+        'steps': [{'name': 'Review', 'description': 'Check it', 'status': 'pending'}]
+    }).json
+    client.post('/api/workflows', headers=admin_headers, json={'name': 'Newer', 'description': 'Untouched', 'status': 'active'})
+
+    step_id = first['steps'][0]['id']
+    response = client.put(f"/api/workflows/{first['id']}/steps/{step_id}", headers=admin_headers, json={'status': 'completed'})
+    assert response.status_code == 200
+    assert client.get('/api/workflows', headers=admin_headers, query_string={'limit': 1}).json[0]['id'] == first['id']
@@ -0,0 +1,57 @@
+import io
+import uuid
+
+import pytest
+
+from search_index import build_match_query
+
+
+def unique_word():
+    return 'fts' + uuid.uuid4().hex[:12]
+
+
+def search(client, headers, text):
+    response = client.get('/api/documents', headers=headers, query_string={'search': text})
+    assert response.status_code == 200
+    return [doc['id'] for doc in response.json]
+
+
+def upload(client, headers, name):
+    return client.post(
+        '/api/documents', headers=headers, content_type='multipart/form-data',
+        data={'file': (io.BytesIO(uuid.uuid4().bytes), name)}
+    ).json['id']
+
+
+def test_triggers_keep_index_in_sync(app_module, client, admin_headers):
+    # Without FTS5 the listing falls back to ILIKE and this would prove nothing
+    assert app_module.search_enabled
+    old, new = unique_word(), unique_word()
+    document_id = upload(client, admin_headers, f'{old} report.txt')
+    assert search(client, admin_headers, old) == [document_id]
+
+    client.put(f'/api/documents/{document_id}', headers=admin_headers, json={'name': f'{new} report.txt'})
+    assert search(client, admin_headers, old) == []
+    assert search(client, admin_headers, new) == [document_id]
+
+    client.delete(f'/api/documents/{document_id}', headers=admin_headers)
+    assert search(client, admin_headers, new) == []
+
+
+def test_prefix_matching(client, admin_headers):
+    word = unique_word()
+    document_id = upload(client, admin_headers, f'{word} minutes.txt')
+    # The last term is a prefix; earlier ones only with an explicit *
+    assert search(client, admin_headers, word[:-4]) == [document_id]
+    assert search(client, admin_headers, f'{word[:-4]}* minutes') == [document_id]
+    assert search(client, admin_headers, f'{word[:-4]} minutes') == []
+
+
+@pytest.mark.parametrize('text', ['"', '"unbalanced', 'a AND OR', 'NEAR(', '(x', '*', '-x', "o'brien", 'name:x', '^x', '%_'])
+def test_special_characters_do_not_break_search(client, admin_headers, text):
+    search(client, admin_headers, text)
+
+
+def test_match_query_quotes_every_term():
+    assert build_match_query('AND "or" x*') == '"AND" "or" "x"*'
+    assert build_match_query('"()*') is None
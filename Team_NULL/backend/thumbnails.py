@@ -0,0 +1,60 @@
+"""Thumbnail generation, run inside job worker processes.
+
+Thumbnails are keyed by the content hash of the source file, so identical
+uploads share them: ``<thumbnail folder>/<hash>/<size>.jpg``.
+"""
+import os
+
+from PIL import Image
+
+try:
+    import fitz  # PyMuPDF, used to rasterize the first page of PDFs
+except ImportError:
+    fitz = None
+
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_IMAGE_TYPES = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tif', 'tiff']
+THUMBNAIL_TYPES = THUMBNAIL_IMAGE_TYPES + ['pdf']
+
+
+def thumbnail_path(folder, content_hash, size):
+    return os.path.join(folder, content_hash, f'{size}.jpg')
+
+
+def pick_size(requested):
+    # Smallest generated size that is at least as large as requested
+    for size in THUMBNAIL_SIZES:
+        if size >= requested:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+def _open_source(file_path, file_type):
+    if file_type == 'pdf':
+        if fitz is None:
+            raise RuntimeError('PyMuPDF is required for PDF thumbnails')
+        with fitz.open(file_path) as pdf:
+            page = pdf[0]
+            # Render just large enough for the biggest thumbnail
+            zoom = max(THUMBNAIL_SIZES) / max(page.rect.width, page.rect.height)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    image = Image.open(file_path)
+    # JPEG decoders can downscale while decoding, which is much cheaper than a full decode
+    image.draft('RGB', (max(THUMBNAIL_SIZES), max(THUMBNAIL_SIZES)))
+    return image
+
+
+def make_thumbnails(payload):
+    folder = os.path.join(payload['folder'], payload['content_hash'])
+    os.makedirs(folder, exist_ok=True)
+    with _open_source(payload['file_path'], payload['file_type'].lower()) as source:
+        source = source.convert('RGB')
+        # Largest first so each step downscales an already small image
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            source.thumbnail((size, size))
+            path = thumbnail_path(payload['folder'], payload['content_hash'], size)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            source.save(tmp_path, 'JPEG', quality=80, optimize=True)
+            os.replace(tmp_path, path)
+    return list(THUMBNAIL_SIZES)
@@ -45,10 +45,17 @@ export const useDocumentStore = create<DocumentState>((set, get) => ({
     set({ isLoading: true, error: null });
     
     try {
-      const response = await api.get('/documents');
-      
+      // The list is paginated; follow X-Next-Cursor until the last page
+      const rows: any[] = [];
+      let cursor: string | undefined;
+      do {
+        const response = await api.get('/documents', { params: { limit: 500, cursor } });
+        rows.push(...response.data);
+        cursor = response.headers['x-next-cursor'];
+      } while (cursor);
+
       // Transform the response data to match our Document interface
-      const documents = response.data.map((doc: any) => ({
+      const documents = rows.map((doc: any) => ({
         id: doc.id,
         name: doc.name,
         type: doc.type,